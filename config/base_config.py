@@ -22,6 +22,8 @@ class BaseConfig(object):
     # model
     load_iter = 0
     epoch = 'latest'
+    ckpt_dtype = None       # 检查点中浮点参数的保存精度（如 t.bfloat16 可使检查点减半），None 表示保持训练精度
+    compile_mode = None     # torch.compile 的模式（如 'max-autotune-no-cudagraphs'），None 表示不编译网络
 
 
     def _parse(self, kwargs):
@@ -1,6 +1,7 @@
 import functools
 import itertools
 import random
+import warnings
 
 import torch
 from torch import nn
@@ -340,6 +341,25 @@ class CycleGANModel(BaseModel):
             self.optimizers.append(self.optimizer_G)
             self.optimizers.append(self.optimizer_D)
 
+        # 按需用 torch.compile 编译网络，把卷积后的归一化、激活和残差相加融合成更少的 kernel。
+        # 单卡时 DataParallel 直接调用内部网络，因此编译 DataParallel 内部的网络，包装留在编译图之外。
+        # 多卡时 DataParallel 的副本会共享编译后绑定在 0 号卡网络上的 forward，因此不编译。
+        # 注意 forward 中同一个生成器会被连续调用两次，不要使用带 CUDA graphs 的模式（如 'max-autotune'），
+        # 否则第二次调用会覆盖第一次的输出。
+        if conf.compile_mode and hasattr(torch, 'compile'):
+            if len(self.gpu_ids) > 1:
+                warnings.warn('torch.compile is not supported with multi-GPU DataParallel (gpu_ids=%s); '
+                              'networks are left uncompiled' % self.gpu_ids)
+            else:
+                for name in self.model_names:
+                    net = getattr(self, 'net' + name)
+                    if isinstance(net, torch.nn.DataParallel):
+                        net.module = torch.compile(net.module, mode=conf.compile_mode, dynamic=False)
+                    else:
+                        setattr(self, 'net' + name, torch.compile(net, mode=conf.compile_mode, dynamic=False))
+                # 网络被重新绑定，清空 _iter_nets 的缓存
+                self._nets = None
+
     def set_input(self, input):
         # print('task: ', self.conf.task)
         task = self.conf.task == 'AtoB'
@@ -1,12 +1,18 @@
 import torch
 import torch.nn as nn
-import numpy as np
+import torch.nn.functional as F
+import torch.distributed as dist
 from torch.nn import init
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from torch.optim import lr_scheduler
+from torch.nn.modules.utils import consume_prefix_in_state_dict_if_present
 import functools
 import os
+import atexit
+import errno
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
 
 class BaseModel(nn.Module):
@@ -28,16 +34,34 @@ class BaseModel(nn.Module):
         self.isTrain = conf.isTrain
         self.gpu_ids = conf.gpu_ids
         self.device = torch.device('cuda:{}'.format(self.gpu_ids[0])) if self.gpu_ids else torch.device('cpu')
-        self.save_dir = os.path.join(conf.save_dir, conf.dataset + conf.task + conf.model)
-        if not os.path.exists(self.save_dir):
-            os.makedirs(self.save_dir)
+        self.save_dir = os.path.normpath(os.path.join(conf.save_dir, conf.dataset + conf.task + conf.model))
+        os.makedirs(self.save_dir, exist_ok=True)     # 多个进程同时创建时不会因目录已存在而报错
         self.loss_names = []
         self.visual_names = []
         self.optimizers = []
         self.model_names = []
+        self._nets = None               # _iter_nets 的缓存，第一次调用时构建
         self.image_paths = []
         self.metric = 0
         self.emaG = None
+        self.ckpt_dtype = get_ckpt_dtype(getattr(conf, 'ckpt_dtype', None))   # 检查点中浮点参数的保存精度
+        self._pinned_buffers = {}      # 每个网络一份固定内存暂存区，保存检查点时复用
+        self._save_executor = None     # 后台写盘线程，第一次保存时创建
+        self._pending_saves = []       # 尚未完成的后台保存任务
+        # 保存检查点时 GPU→CPU 拷贝使用的独立 CUDA 流，不占用默认计算流
+        self._save_stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+
+    def _iter_nets(self):
+        """
+        返回 (网络名称, 网络) 列表。
+
+        第一次调用时根据 model_names 查找 self.net<name> 并缓存，之后直接复用，
+        避免每次都拼接属性名和 getattr 查找。之后如果修改了 model_names 或重新绑定了 self.net<name>，
+        需要把 self._nets 置为 None 使缓存失效。
+        """
+        if self._nets is None:
+            self._nets = [(name, getattr(self, 'net' + name)) for name in self.model_names]
+        return self._nets
 
     @abstractmethod
     def forward(self):
@@ -80,6 +104,10 @@ class BaseModel(nn.Module):
         参数:
         - conf: 配置对象，包含了模型训练或测试的各种参数。
         """
+        # 名称列表在构建模型时就已确定，这里统一检查一次，各个方法中不再逐项检查
+        assert all(isinstance(name, str) for name in self.model_names + self.visual_names + self.loss_names)
+        # 预先拼接好损失属性名，get_current_losses 每次调用时不再重复拼接字符串
+        self._loss_attr_names = ['loss_' + name for name in self.loss_names]
         # 如果模型是训练状态，则初始化调度器列表
         if self.isTrain:
             self.schedulers = [get_scheduler(optimizer, conf) for optimizer in self.optimizers]
@@ -97,10 +125,8 @@ class BaseModel(nn.Module):
         self.print_networks(conf.verbose)
 
     def eval(self):
-        for name in self.model_names:
-            if isinstance(name, str):       # 网络名称是否为字符串类型
-                net = getattr(self, 'net' + name)   # 假如说name='G_A2B' 那net加载的就是self.netG_A2B
-                net.eval()                  # 将网络设置为评估模式
+        for name, net in self._iter_nets():     # 假如说name='G_A2B' 那net就是self.netG_A2B
+            net.eval()                          # 将网络设置为评估模式
 
     def test(self):
         """
@@ -133,23 +159,22 @@ class BaseModel(nn.Module):
         此方法根据预定义的学习率策略，调整优化器的学习率。它支持不同的学习率策略，包括但不限于'plateau'，
         并根据当前指标或直接按预定计划调整学习率。在调整前后，它会记录并打印出学习率的变化。
         """
+        optimizer = self.optimizers[0]
         # 记录更新前的学习率
-        old_lr = self.optimizers[0].param_groups[0]['lr']
+        old_lr = optimizer.param_groups[0]['lr']
 
-        print("------------==================-----------------", self.schedulers)
-
-        # 遍历所有学习率调度器
-        for scheduler in self.schedulers:
-            # 根据配置的策略更新学习率
-            if self.conf.lr_policy == 'plateau':
+        # 根据配置的策略更新所有学习率调度器，策略判断放在循环外只做一次
+        if self.conf.lr_policy == 'plateau':
+            for scheduler in self.schedulers:
                 scheduler.step(self.metric)  # 对于plateau策略，需要传入当前指标作为参数
-            else:
+        else:
+            for scheduler in self.schedulers:
                 scheduler.step()  # 其他策略直接调用 step方法
 
-        # 记录更新后的学习率
-        lr = self.optimizers[0].param_groups[0]['lr']
-        # 输出学习率的变化情况
-        print('learning rate %.7f -> %.7f' % (old_lr, lr))
+        # 记录更新后的学习率，多进程训练时只由 rank 0 输出学习率的变化情况
+        lr = optimizer.param_groups[0]['lr']
+        if get_dist_info()[0] == 0:
+            print('learning rate %.7f -> %.7f' % (old_lr, lr))
 
     def get_current_visuals(self):
         """
@@ -166,10 +191,8 @@ class BaseModel(nn.Module):
         visual_ret = OrderedDict()
         # 遍历视觉元素的名称列表
         for name in self.visual_names:
-            # 检查名称是否为字符串，以确保其有效性
-            if isinstance(name, str):
-                # 从实例中获取对应名称的视觉元素，并添加到有序字典中
-                visual_ret[name] = getattr(self, name)
+            # 从实例中获取对应名称的视觉元素，并添加到有序字典中
+            visual_ret[name] = getattr(self, name)
         # 返回包含所有视觉元素的有序字典
         return visual_ret
 
@@ -183,24 +206,21 @@ class BaseModel(nn.Module):
         Returns:
             OrderedDict: 一个有序字典，包含所有损失的名称和它们的当前值。
         """
-        # 初始化一个有序字典，用于存储损失名称和对应的损失值
-        errors_ret = OrderedDict()
-
-        # 遍历损失名称列表
-        for name in self.loss_names:
-            # 检查名称是否为字符串，确保名称格式正确
-            if isinstance(name, str):
-                # 通过属性名动态获取损失值，并将其转换为浮点类型，然后存储到字典中
-                errors_ret[name] = float(getattr(self, 'loss_' + name))
-        # 返回包含所有损失的有序字典
-        return errors_ret
+        if not self._loss_attr_names:
+            return OrderedDict()
+        # 把所有损失拼成一个张量后一次性拷回 CPU，只同步一次，而不是每个损失 float() 各同步一次。
+        # 损失也可能是 Python 数值（例如不使用 identity loss 时设为 0），统一转换为同一设备上的张量
+        losses = [torch.as_tensor(getattr(self, attr_name), dtype=torch.float32, device=self.device).detach()
+                  for attr_name in self._loss_attr_names]
+        values = torch.stack(losses).cpu().tolist()
+        return OrderedDict(zip(self.loss_names, values))
 
     def save_networks(self, epoch):
         """
         保存网络模型的参数。
 
         如果epoch被指定为'latest'且存在指数移动平均(EMA)的G网络，则应用EMA阴影。
-        遍历所有模型名称，逐个保存模型的参数。保存路径基于epoch和模型名称。
+        遍历所有模型名称，把参数拷贝到固定内存后交给后台线程写盘。保存路径基于epoch和模型名称。
 
         参数:
         - self: 实例引用。
@@ -213,80 +233,151 @@ class BaseModel(nn.Module):
             self.emaG.apply_shadow()
             print('The latest using EMA.')
 
-        # 遍历所有模型名称，逐个保存模型的参数
-        for name in self.model_names:
-            if isinstance(name, str):
-                # 构建保存文件名
-                save_filename = '%s_net_%s.pth' % (epoch, name)
-                save_path = os.path.join(self.save_dir, save_filename)
-                net = getattr(self, 'net' + name)
+        # 等待上一次的后台保存完成，保证写盘顺序，同时暂存区可以安全复用
+        self._wait_for_saves()
+
+        # 多进程训练时各个 rank 轮流分担网络的保存，每个 rank 只写自己负责的检查点文件
+        rank, world_size = get_dist_info()
+        nets = [(name, net) for i, (name, net) in enumerate(self._iter_nets()) if i % world_size == rank]
+
+        # 遍历这些网络，先把参数拷贝到固定内存暂存区（GPU→CPU）
+        if self._save_stream is not None:
+            # 拷贝在独立的流上进行，先等待计算流上已发出的参数更新完成
+            self._save_stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(self._save_stream):
+                staged = [(self._checkpoint_path(epoch, name), self._stage_state_dict(name, net))
+                          for name, net in nets]
+            # 所有拷贝都以 non_blocking 方式发出，这里统一同步一次
+            self._save_stream.synchronize()
+        else:
+            staged = [(self._checkpoint_path(epoch, name), self._stage_state_dict(name, net))
+                      for name, net in nets]
+
+        # 写盘交给后台线程，训练循环可以立即继续
+        executor = self._get_save_executor()
+        for save_path, state_dict in staged:
+            self._pending_saves.append(executor.submit(save_state_dict, state_dict, save_path))
+
+        # 分片保存时等所有 rank 都写完，避免某个 rank 读到其他 rank 尚未写完的检查点
+        if world_size > 1:
+            self._wait_for_saves()
+            dist.barrier()
+
+    def _checkpoint_path(self, epoch, name):
+        """返回网络 name 在 epoch 时的检查点文件路径"""
+        return os.path.join(self.save_dir, '%s_net_%s.safetensors' % (epoch, name))
+
+    def _stage_state_dict(self, name, net):
+        """
+        把网络的 state_dict 拷贝到该网络专属的固定内存暂存区。
+
+        暂存区在第一次保存时按参数形状分配，之后每次保存都复用，避免反复申请固定内存。
+        如果设置了 ckpt_dtype，浮点参数在拷贝时顺带转换为该精度（如 bfloat16），检查点体积减半。
 
-                # 保存模型参数
-                # 注释掉的代码是之前用于多GPU训练时的代码，当前使用的是一些简化的保存逻辑
-                torch.save(net.state_dict(), save_path)
+        参数:
+        - name: 网络名称，用作暂存区的键。
+        - net: 需要保存的网络。
 
-    def __patch_instance_norm_state_dict(self, state_dict, module, keys, i=0):
+        返回:
+        - 与 net.state_dict() 键相同、数据位于 CPU 的有序字典。
+        """
+        # torch.compile 包装后的网络取原始模块，保证检查点的键不带 '_orig_mod.' 前缀
+        if isinstance(net, PARALLEL_WRAPPERS):
+            state_dict = unwrap_network(net).state_dict(prefix='module.')
+        else:
+            state_dict = unwrap_network(net).state_dict()
+        buffers = self._pinned_buffers.get(name)
+        if buffers is None:
+            pin_memory = self.device.type == 'cuda'
+            buffers = OrderedDict()
+            for k, v in state_dict.items():
+                dtype = self.ckpt_dtype if self.ckpt_dtype is not None and v.is_floating_point() else v.dtype
+                buffers[k] = torch.empty(v.shape, dtype=dtype, pin_memory=pin_memory)
+            self._pinned_buffers[name] = buffers
+        for k, v in state_dict.items():
+            buffers[k].copy_(v, non_blocking=True)
+        return buffers
+
+    def _get_save_executor(self):
+        """返回用于后台写盘的单线程执行器，并在进程退出前等待所有保存任务完成"""
+        if self._save_executor is None:
+            self._save_executor = ThreadPoolExecutor(max_workers=1)
+            atexit.register(self._wait_for_saves)
+        return self._save_executor
+
+    def _wait_for_saves(self):
+        """等待所有尚未完成的后台保存任务，写盘时的异常会在这里重新抛出"""
+        pending, self._pending_saves = self._pending_saves, []
+        for future in pending:
+            future.result()
+
+    def __patch_instance_norm_state_dict(self, state_dict, net):
         """
         修复 InstanceNorm 检查点在 0.4 版本之前的不兼容问题
 
         该函数用于解决 0.4 版本之前 InstanceNorm 检查点的兼容性问题。
         它根据模块类型和键名检查并更新 state_dict，移除不兼容的键。
+        所有子模块通过一次 named_modules() 建立名称索引，对 state_dict 的键只做一次线性扫描，不再逐层递归。
 
         参数:
         - state_dict: 模型的状态字典，记录了每一层的状态。
-        - module: 当前正在检查的模块（层）。
-        - keys: 字符串列表，用于定位状态字典中的特定键。
-        - i: 当前在 keys 列表中的索引，用于递归。
-        """
-        # 获取当前正在检查的键
-        key = keys[i]
-
-        # 检查当前键是否指向模块末尾的参数或缓冲区
-        if i + 1 == len(keys):
-            # 检查当前模块是否为 InstanceNorm 类型，且键名为 running_mean 或 running_var
-            if module.__class__.__name__.startswith('InstanceNorm') and \
-                    (key == 'running_mean' or key == 'running_var'):
-                # 如果当前模块的 running_mean 或 running_var 为 None，则从 state_dict 中移除该键
-                if getattr(module, key) is None:
-                    state_dict.pop('.'.join(keys))
-            # 检查当前模块是否为 InstanceNorm 类型，且键名为 num_batches_tracked
-            if module.__class__.__name__.startswith('InstanceNorm') and \
-                    (key == 'num_batches_tracked'):
-                # 从 state_dict 中移除 num_batches_tracked 键
-                state_dict.pop('.'.join(keys))
-        else:
-            # 如果当前键不是模块末尾的键，则递归检查下一个键
-            self.__patch_instance_norm_state_dict(state_dict, getattr(module, key), keys, i + 1)
+        - net: 要加载该状态字典的网络。
+        """
+        named_modules = dict(net.named_modules())
+        for key in list(state_dict.keys()):  # 需要复制键列表，因为循环中会修改 state_dict
+            # 键的最后一段是参数或缓冲区名，前面部分是所属模块的名称
+            module_name, _, attr = key.rpartition('.')
+            module = named_modules.get(module_name)
+            if module is None or not module.__class__.__name__.startswith('InstanceNorm'):
+                continue
+            # running_mean / running_var 在当前模块中为 None 时移除；num_batches_tracked 一律移除
+            if attr == 'num_batches_tracked' or \
+                    (attr in ('running_mean', 'running_var') and getattr(module, attr) is None):
+                state_dict.pop(key)
 
     def load_networks(self, epoch):
         """Load all the networks from the disk.
 
         Parameters:
-            epoch (int) -- current epoch; used in the file name '%s_net_%s.pth' % (epoch, name)
-        """
-        for name in self.model_names:
-            if isinstance(name, str):
-                load_filename = '%s_net_%s.pth' % (epoch, name)
-                load_path = os.path.join(self.save_dir, load_filename)
-                net = getattr(self, 'net' + name)
-                if isinstance(net, torch.nn.DataParallel):
-                    net = net.module
+            epoch (int) -- current epoch; used in the file name '%s_net_%s.safetensors' % (epoch, name)
+
+        Every rank reads all the checkpoint files, including those written by other ranks in save_networks.
+        Checkpoints saved before the switch to safetensors ('%s_net_%s.pth') are still loaded with torch.load.
+        Weights saved in reduced precision (see ckpt_dtype) are cast back to each parameter's dtype by load_state_dict.
+        """
+        # 先确定每个网络的检查点路径，没有 safetensors 文件时兼容旧的 pickle 格式检查点
+        checkpoints = []
+        for name, net in self._iter_nets():
+            load_path = self._checkpoint_path(epoch, name)
+            if not os.path.exists(load_path):
+                load_path = os.path.join(self.save_dir, '%s_net_%s.pth' % (epoch, name))
+            checkpoints.append((net, load_path))
+
+        def deserialize(load_path):
+            # 在 CPU 上反序列化并原地去掉 DataParallel 的 'module.' 前缀，不再复制出第二份 state_dict
+            # （不是用 DataParallel 保存的检查点没有该前缀，保持原样）
+            state_dict = read_state_dict(load_path)
+            consume_prefix_in_state_dict_if_present(state_dict, 'module.')
+            return state_dict
+
+        # 读盘、反序列化在线程池中对所有网络并行进行，主线程按顺序把已就绪的参数拷贝到网络中，
+        # 这样前一个网络的 H2D 拷贝与后面网络的读盘/反序列化相互重叠
+        load_paths = [load_path for _, load_path in checkpoints]
+        with ThreadPoolExecutor(max_workers=max(len(checkpoints), 1)) as executor:
+            # 并发预读所有检查点文件，后面的反序列化直接命中页缓存
+            list(executor.map(prefetch_file, load_paths))
+            futures = [executor.submit(deserialize, load_path) for load_path in load_paths]
+
+            for (net, load_path), future in zip(checkpoints, futures):
+                net = unwrap_network(net)
                 print('loading the model from %s' % load_path)
-                # if you are using PyTorch newer than 0.4 (e.g., built from
-                # GitHub source), you can remove str() on self.device
-                state_dict = torch.load(load_path, map_location=str(self.device))
-                new_state_dict = OrderedDict()
-                for k, v in state_dict.items():
-                    name = k[7:]
-                    new_state_dict[name] = v
-                net.load_state_dict(new_state_dict)
+                net.load_state_dict(future.result())
 
                 # if hasattr(state_dict, '_metadata'):
                 #     del state_dict._metadata
 
                 # # patch InstanceNorm checkpoints prior to 0.4
-                # for key in list(state_dict.keys()):  # need to copy keys here because we mutate in loop
-                #     self.__patch_instance_norm_state_dict(state_dict, net, key.split('.'))
+                # self.__patch_instance_norm_state_dict(state_dict, net)
                 # net.load_state_dict(state_dict)
 
 
@@ -297,29 +388,37 @@ class BaseModel(nn.Module):
             verbose (bool) -- if verbose: print the network architecture
         """
         print('---------- Networks initialized -------------')
-        for name in self.model_names:
-            if isinstance(name, str):
-                net = getattr(self, 'net' + name)
-                num_params = 0
-                for param in net.parameters():
-                    num_params += param.numel()
-                if verbose:
-                    print(net)
-                print('[Network %s] Total number of parameters : %.3f M' % (name, num_params / 1e6))
+        for name, net in self._iter_nets():
+            # 参数量在网络构建后不会变化，第一次统计后缓存在网络上
+            if not hasattr(net, '_cached_numel'):
+                net._cached_numel = sum(p.numel() for p in net.parameters())
+            num_params = net._cached_numel
+            if verbose:
+                print(net)
+            print('[Network %s] Total number of parameters : %.3f M' % (name, num_params / 1e6))
         print('-----------------------------------------------')
 
     def set_requires_grad(self, nets, requires_grad=False):
         """Set requies_grad=Fasle for all the networks to avoid unnecessary computations
         Parameters:
-            nets (network list)   -- a list of networks
+            nets (network list)   -- a network, or a list/tuple of networks
             requires_grad (bool)  -- whether the networks require gradients or not
         """
-        if not isinstance(nets, list):
-            nets = [nets]
+        # 单个网络直接包成元组，列表/元组原样遍历
+        if nets is None or isinstance(nets, nn.Module):
+            nets = (nets,)
         for net in nets:
-            if net is not None:
-                for param in net.parameters():
-                    param.requires_grad = requires_grad
+            if net is None:
+                continue
+            # 缓存参数列表，避免每次迭代都重新遍历模块树
+            params = getattr(net, '_cached_params', None)
+            if params is None:
+                params = net._cached_params = list(net.parameters())
+            # 已经处于目标状态时直接跳过（G/D 交替训练中最常见的情况）
+            if not params or params[0].requires_grad == requires_grad:
+                continue
+            for param in params:
+                param.requires_grad_(requires_grad)
 
 
 class Identity(nn.Module):
@@ -403,8 +502,10 @@ class Norm(nn.Module):
 
 
     # 先对输入 x 进行层归一化处理，然后将结果传递给 fn 函数，并返回最终结果
+    # 直接调用 F.layer_norm，省去一次模块调用，便于 torch.compile 把归一化与后面的线性层融合
     def forward(self, x):
-        return self.fn(self.norm(x))
+        norm = self.norm
+        return self.fn(F.layer_norm(x, norm.normalized_shape, norm.weight, norm.bias, norm.eps))
 
 
 class FeedForward(nn.Module):
@@ -923,6 +1024,118 @@ class UpADBlock(nn.Module):
         return x + res
 
 
+def prefetch_file(path, chunk_size=1 << 20):
+    """Ask the OS to read a checkpoint file into the page cache ahead of deserialization.
+
+    Parameters:
+        path (str)       -- the file to prefetch
+        chunk_size (int) -- read size used when posix_fadvise is not available (e.g. on Windows)
+    """
+    with open(path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.read(chunk_size):
+                pass
+
+
+# 会给 state_dict 的键加上 'module.' 前缀的多卡包装类
+PARALLEL_WRAPPERS = (nn.DataParallel, nn.parallel.DistributedDataParallel)
+
+
+def unwrap_network(net):
+    """Return the plain network inside the (Distributed)DataParallel and torch.compile wrappers, if any."""
+    if isinstance(net, PARALLEL_WRAPPERS):
+        net = net.module
+    return getattr(net, '_orig_mod', net)
+
+
+def get_ckpt_dtype(dtype):
+    """Return the torch dtype used for floating-point checkpoint entries, or None to keep training precision.
+
+    Parameters:
+        dtype (torch.dtype | str | None) -- e.g. torch.bfloat16 or 'bfloat16' (as passed on the command line)
+    """
+    if dtype is None:
+        return None
+    torch_dtype = getattr(torch, dtype, None) if isinstance(dtype, str) else dtype
+    if not isinstance(torch_dtype, torch.dtype) or not torch_dtype.is_floating_point:
+        raise ValueError('checkpoint dtype [%s] is not a floating-point torch dtype' % (dtype,))
+    return torch_dtype
+
+
+def get_dist_info():
+    """Return (rank, world_size) of this process; (0, 1) when torch.distributed is not initialized."""
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+def save_state_dict(state_dict, path):
+    """Serialize a state_dict in safetensors format and write it with write_file_direct."""
+    from safetensors.torch import save as serialize_state_dict    # 只在保存/读取检查点时才需要 safetensors
+    write_file_direct(path, serialize_state_dict(state_dict))
+
+
+def write_file_direct(path, data, block_size=4 << 20, alignment=4096):
+    """Write bytes to a file with O_DIRECT, bypassing the page cache.
+
+    Parameters:
+        path (str)         -- the file to write
+        data (bytes)       -- the file content
+        block_size (int)   -- size of the aligned bounce buffer; each os.write call writes at most this much
+        alignment (int)    -- block alignment required by O_DIRECT; the last block is zero-padded and
+                              the file is truncated back to len(data) afterwards
+
+    Falls back to a normal buffered write where O_DIRECT is unavailable (e.g. Windows) or rejected by the
+    file system (e.g. tmpfs).
+    """
+    o_direct = getattr(os, 'O_DIRECT', 0)
+    if o_direct:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | o_direct, 0o644)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+        else:
+            try:
+                _write_aligned(fd, data, block_size, alignment)
+                os.ftruncate(fd, len(data))
+                return
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+            finally:
+                os.close(fd)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _write_aligned(fd, data, block_size, alignment):
+    # 匿名 mmap 的起始地址按页对齐，满足 O_DIRECT 对缓冲区地址的要求
+    buf = mmap.mmap(-1, block_size)
+    try:
+        with memoryview(data) as src, memoryview(buf) as dst:
+            for offset in range(0, len(data), block_size):
+                n = min(block_size, len(data) - offset)
+                dst[:n] = src[offset:offset + n]
+                padded = -(-n // alignment) * alignment
+                dst[n:padded] = bytes(padded - n)
+                written = 0
+                while written < padded:
+                    written += os.write(fd, dst[written:padded])
+    finally:
+        buf.close()
+
+
+def read_state_dict(path):
+    """Read a checkpoint into a CPU state_dict; supports both safetensors and legacy torch.save files."""
+    if path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        return load_file(path, device='cpu')
+    return torch.load(path, map_location='cpu')
+
+
 def init_weights(net, init_type='normal', init_gain=0.02):
     """Initialize network weights.
 